@@ -6,12 +6,16 @@
 # - Refresco automático tras registrar (st.rerun)
 # - Exportar: Situación actual (CSV ; y ,) + Base completa (ZIP con CSV ; y , + backup .db)
 # - Normaliza usuarios (TRIM) para resumen correcto
+# - Lecturas cacheadas (st.cache_data) por mtime de la base; se invalidan al registrar
 
-import os, io, zipfile, tempfile
+import os, io, zipfile, tempfile, threading
 import sqlite3
 from pathlib import Path
 from datetime import datetime, date
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import streamlit as st
 
 # --------------------------- Config & estilo ---------------------------
@@ -37,16 +41,20 @@ st.markdown(f"""
 
 def parse_time_any(texto: str):
     """Acepta: '9 PM', '9:05 PM', '21:05', '09'. Devuelve time o None."""
-    from datetime import datetime as _dt
     s = (texto or "").strip().upper().replace(".", "")
-    formatos = ["%I:%M %p", "%I %p", "%H:%M", "%H"]
-    for fmt in formatos:
-        try:
-            dt = _dt.strptime(s, fmt)
-            return dt.time().replace(second=0, microsecond=0)
-        except Exception:
-            pass
-    return None
+    if not s:
+        return None
+    # Elegir el formato mirando el texto (AM/PM, ':') en vez de probar strptime con excepciones
+    has_ampm = s.endswith("AM") or s.endswith("PM")
+    has_colon = ":" in s
+    if has_ampm:
+        fmt = "%I:%M %p" if has_colon else "%I %p"
+    else:
+        fmt = "%H:%M" if has_colon else "%H"
+    try:
+        return datetime.strptime(s, fmt).time().replace(second=0, microsecond=0)
+    except ValueError:
+        return None
 
 def fmt_miles(n: float) -> str:
     """Devuelve 100000 -> '100.000' (puntos de miles, sin decimales)."""
@@ -62,15 +70,73 @@ def puntos_por_monto(monto: float) -> float:
 # --------------------------- Base de datos ----------------------------
 
 DB_PATH = Path(os.getenv("STARPOINT_DB", "StarPoint.db"))
+# La conexión de escritura (st.cache_resource) la comparten todas las sesiones y el hilo de las descargas:
+# cada escritura y cada backup toman este lock para no mezclar transacciones entre hilos
+_DB_LOCK = threading.Lock()
+# Ídem para la conexión de solo lectura compartida (_bootstrap_ro): una consulta (execute + fetch) a la vez
+_RO_LOCK = threading.Lock()
 
 def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES, check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
     with conn:
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute("PRAGMA foreign_keys=ON;")
+        # WAL + NORMAL: menos fsync por escritura; caché grande + mmap para servir lecturas desde memoria
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA cache_size=-65536;")       # 64 MB
+        conn.execute("PRAGMA mmap_size=268435456;")     # 256 MB
+        conn.execute("PRAGMA wal_autocheckpoint=1000;")
+    return conn
+
+def _ro_uri(db_path: str | Path) -> str:
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro"
+
+def get_ro_conn(db_path: str | Path = DB_PATH) -> sqlite3.Connection:
+    """Conexión de solo lectura para lecturas; las escrituras siguen usando get_conn()."""
+    conn = sqlite3.connect(_ro_uri(db_path), uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # cache_size / mmap_size / temp_store son por conexión: las lecturas necesitan los suyos (ver get_conn)
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-65536;")       # 64 MB
+    conn.execute("PRAGMA mmap_size=268435456;")     # 256 MB
+    conn.create_function("fmt_miles", 1, fmt_miles, deterministic=True)  # formateo de montos desde SQL
     return conn
 
+def _fast_read_sql(conn: sqlite3.Connection, q: str, params: tuple = ()) -> pd.DataFrame:
+    """Resultados chicos: cursor + DataFrame.from_records, sin el camino pesado de pd.read_sql_query."""
+    cur = conn.execute(q, params)
+    return pd.DataFrame.from_records(cur.fetchall(), columns=[c[0] for c in cur.description])
+
+# Esquemas explícitos: el tipo no depende de las primeras filas (p. ej. monto/puntos NULL en retiros)
+MOVIMIENTOS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("usuario", pa.string()),
+    ("monto", pa.float64()),
+    ("fecha", pa.string()),
+    ("puntos", pa.float64()),
+])
+
+def _read_arrow(conn: sqlite3.Connection, q: str, schema: pa.Schema, params: tuple = ()) -> pa.Table:
+    """Tablas completas: columnas del cursor directo a Arrow con el esquema dado, sin pasar por pandas."""
+    with _RO_LOCK:
+        cur = conn.cursor()
+        cur.row_factory = None  # tuplas, no sqlite3.Row
+        filas = cur.execute(q, params).fetchall()
+    cols = list(zip(*filas)) or [()] * len(schema)
+    return pa.Table.from_arrays([pa.array(col, type=f.type) for col, f in zip(cols, schema)], schema=schema)
+
+def db_mtime() -> int:
+    """Versión del estado de la base (mtime del .db y su -wal), usada como clave de caché."""
+    v = DB_PATH.stat().st_mtime_ns
+    try:
+        # El -wal puede borrarse en cualquier momento (checkpoint/cierre): FileNotFoundError en vez de exists()
+        v = max(v, DB_PATH.with_name(DB_PATH.name + "-wal").stat().st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return v
+
 def init_db(conn: sqlite3.Connection):
     with conn:
         conn.execute("""
@@ -91,51 +157,88 @@ def init_db(conn: sqlite3.Connection):
               puntos REAL
             );
         """)
-        # Reparación de nulos para que no aparezca "None" en historial
-        conn.execute("UPDATE cargas  SET ts            = COALESCE(ts,            CURRENT_TIMESTAMP) WHERE ts            IS NULL;")
-        conn.execute("UPDATE retiros SET notificado_en = COALESCE(notificado_en, CURRENT_TIMESTAMP) WHERE notificado_en IS NULL;")
+        # Índices por usuario: búsquedas puntuales, orden por fecha y SUM sin tocar la tabla (covering)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cargas_usuario_ts        ON cargas(usuario, ts DESC);")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_retiros_usuario_ts       ON retiros(usuario, notificado_en DESC);")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cargas_usuario_covering  ON cargas(usuario, puntos, monto, ts);")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_retiros_usuario_covering ON retiros(usuario, puntos, monto, notificado_en);")
+    migrar_db(conn)
+
+def migrar_db(conn: sqlite3.Connection):
+    """Migraciones de una sola vez, versionadas con PRAGMA user_version."""
+    v = conn.execute("PRAGMA user_version;").fetchone()[0]
+    if v < 1:
+        with conn:
+            # Reparación de nulos para que no aparezca "None" en historial
+            conn.execute("UPDATE cargas  SET ts            = COALESCE(ts,            CURRENT_TIMESTAMP) WHERE ts            IS NULL;")
+            conn.execute("UPDATE retiros SET notificado_en = COALESCE(notificado_en, CURRENT_TIMESTAMP) WHERE notificado_en IS NULL;")
+            conn.execute("PRAGMA user_version=1;")
+    normalize_users(conn)
 
 def normalize_users(conn):
-    """Normaliza usuarios (TRIM) para evitar duplicados por espacios en el resumen."""
+    """
+    Normaliza usuarios (TRIM) para evitar duplicados por espacios en el resumen.
+    Migración v2, de una sola vez: los insert ya guardan usuario.strip().
+    """
+    v = conn.execute("PRAGMA user_version;").fetchone()[0]
+    if v >= 2:
+        return
     with conn:
         conn.execute("UPDATE cargas  SET usuario = TRIM(usuario) WHERE usuario != TRIM(usuario);")
         conn.execute("UPDATE retiros SET usuario = TRIM(usuario) WHERE usuario != TRIM(usuario);")
+        conn.execute("PRAGMA user_version=2;")
 
-def list_usuarios(conn: sqlite3.Connection) -> list[str]:
-    q = """
-    SELECT usuario
-    FROM (SELECT usuario FROM cargas UNION SELECT usuario FROM retiros) t
-    ORDER BY usuario COLLATE NOCASE;
-    """
-    return [r["usuario"] for r in conn.execute(q).fetchall()]
+def invalidar_cache():
+    """Descarta los resultados cacheados tras cualquier escritura."""
+    historial_usuario.clear()
+    resumen_general.clear()
 
 def insertar_carga(conn: sqlite3.Connection, usuario: str, monto: float, ts: datetime, puntos: float):
-    with conn:
+    with _DB_LOCK, conn:
         conn.execute(
             "INSERT INTO cargas(usuario, monto, ts, puntos) VALUES (?, ?, ?, ?);",
             (usuario.strip(), float(monto), ts, float(puntos))
         )
+    invalidar_cache()
+
+def insertar_cargas_bulk(conn: sqlite3.Connection, rows: list[tuple[str, float, datetime, float]]):
+    """Inserta muchas cargas (usuario, monto, ts, puntos) en una sola transacción: un fsync en vez de N."""
+    datos = [(u.strip(), float(m), ts, float(p)) for u, m, ts, p in rows]
+    with _DB_LOCK, conn:
+        conn.execute("BEGIN IMMEDIATE;")
+        conn.executemany("INSERT INTO cargas(usuario, monto, ts, puntos) VALUES (?, ?, ?, ?);", datos)
+    invalidar_cache()
 
 def insertar_retiro(conn: sqlite3.Connection, usuario: str, ts: datetime, monto: float, puntos: float):
-    with conn:
+    with _DB_LOCK, conn:
         conn.execute(
             "INSERT INTO retiros(usuario, notificado_en, monto, puntos) VALUES (?, ?, ?, ?);",
             (usuario.strip(), ts, float(monto), float(puntos))
         )
+    invalidar_cache()
 
 def total_puntos_usuario(conn: sqlite3.Connection, usuario: str) -> float:
-    row_c = conn.execute("SELECT COALESCE(SUM(puntos),0) AS t FROM cargas  WHERE usuario=?;", (usuario,)).fetchone()
-    row_r = conn.execute("SELECT COALESCE(SUM(puntos),0) AS t FROM retiros WHERE usuario=?;", (usuario,)).fetchone()
-    return float((row_c["t"] or 0.0) - (row_r["t"] or 0.0))
-
-def historial_usuario(conn: sqlite3.Connection, usuario: str, limit: int = 200) -> pd.DataFrame:
-    # Formateo y orden desde SQL; siempre hay fecha válida (ver reparación en init)
+    # Una sola consulta (usuario ligado una vez con ?1); ambas subconsultas usan el índice covering
+    with _RO_LOCK:
+        row = conn.execute("""
+            SELECT
+              (SELECT COALESCE(SUM(puntos),0) FROM cargas  WHERE usuario=?1) AS c,
+              (SELECT COALESCE(SUM(puntos),0) FROM retiros WHERE usuario=?1) AS r;
+        """, (usuario,)).fetchone()
+    return float(row["c"] - row["r"])
+
+# max_entries: si otro proceso escribe, cambia el mtime sin invalidar_cache() y las claves viejas se acumularían
+@st.cache_data(ttl=None, max_entries=256, show_spinner=False)
+def historial_usuario(_conn: sqlite3.Connection, db_path: str, mtime: int, usuario: str, limit: int = 200) -> pd.DataFrame:
+    # _conn (conexión ro compartida) no entra en la clave de caché: la base la identifica db_path
+    # Formateo (fecha, montos "2.000", puntos a 2 decimales) y orden desde SQL;
+    # siempre hay fecha válida (ver reparación en migrar_db)
     q = """
     SELECT dt,
            fecha_fmt AS "Fecha/Hora",
            tipo       AS "Tipo",
-           monto      AS "Monto",
-           puntos_vis AS "Puntos"
+           CASE WHEN monto IS NULL THEN '' ELSE fmt_miles(monto) END AS "Monto",
+           printf('%.2f', puntos_vis) AS "Puntos"
     FROM (
         SELECT
           COALESCE(ts, CURRENT_TIMESTAMP)                                        AS dt,
@@ -156,61 +259,60 @@ def historial_usuario(conn: sqlite3.Connection, usuario: str, limit: int = 200)
     ORDER BY dt DESC
     LIMIT ?;
     """
-    return pd.read_sql_query(q, conn, params=(usuario, usuario, limit))
+    with _RO_LOCK:
+        return _fast_read_sql(_conn, q, (usuario, usuario, limit))
 
 # -------- Resumen general (todos los usuarios) --------
-def resumen_general(conn):
+@st.cache_data(ttl=None, max_entries=4, show_spinner=False)
+def resumen_general(_conn: sqlite3.Connection, db_path: str, mtime: int) -> pd.DataFrame:
     """
-    Resumen por usuario con montos, puntos y último movimiento.
-    Agrupa por TRIM(usuario) para evitar duplicados por espacios.
+    Resumen por usuario con montos, puntos (redondeados a 2 decimales) y último movimiento.
+    Los usuarios ya están normalizados (TRIM) por la migración v2 y el strip() al insertar.
+    Cacheado por (db_path, mtime): se recalcula sólo si cambió la base; _conn queda fuera de la clave.
     """
     q = """
-    WITH
-    u AS (
-      SELECT TRIM(usuario) AS usuario FROM cargas
-      UNION
-      SELECT TRIM(usuario) AS usuario FROM retiros
-    ),
-    c AS (
-      SELECT TRIM(usuario) AS usuario,
-             SUM(monto) AS monto_c,
-             SUM(puntos) AS pts_c,
-             MAX(ts)    AS last_c
-      FROM cargas
-      GROUP BY TRIM(usuario)
-    ),
-    r AS (
-      SELECT TRIM(usuario) AS usuario,
-             SUM(monto) AS monto_r,
-             SUM(puntos) AS pts_r,
-             MAX(notificado_en) AS last_r
-      FROM retiros
-      GROUP BY TRIM(usuario)
-    )
+    -- Cada tabla se agrega por usuario recorriendo su índice covering (sin TEMP B-TREE);
+    -- UNION ALL de esos parciales (una fila por usuario y tabla) y GROUP BY final, sin JOIN
     SELECT
-      u.usuario AS Usuario,
-      COALESCE(c.monto_c, 0) AS Monto_cargas,
-      COALESCE(r.monto_r, 0) AS Monto_descargas,
-      COALESCE(c.pts_c, 0)   AS Puntos_cargas,
-      COALESCE(r.pts_r, 0)   AS Puntos_descargas,
-      COALESCE(c.pts_c, 0) - COALESCE(r.pts_r, 0) AS Puntos_actuales,
-      strftime('%d/%m/%Y %H:%M', MAX(COALESCE(c.last_c, r.last_r))) AS Ultimo_movimiento
-    FROM u
-    LEFT JOIN c ON c.usuario = u.usuario
-    LEFT JOIN r ON r.usuario = u.usuario
-    GROUP BY u.usuario
-    ORDER BY u.usuario COLLATE NOCASE;
+      usuario AS Usuario,
+      ROUND(SUM(monto_c), 2)             AS Monto_cargas,
+      ROUND(SUM(monto_r), 2)             AS Monto_descargas,
+      ROUND(SUM(pts_c), 2)               AS Puntos_cargas,
+      ROUND(SUM(pts_r), 2)               AS Puntos_descargas,
+      ROUND(SUM(pts_c) - SUM(pts_r), 2)  AS Puntos_actuales,
+      strftime('%d/%m/%Y %H:%M', MAX(last)) AS Ultimo_movimiento
+    FROM (
+      SELECT usuario, TOTAL(monto) AS monto_c, 0.0 AS monto_r, TOTAL(puntos) AS pts_c, 0.0 AS pts_r, MAX(ts) AS last
+      FROM cargas GROUP BY usuario
+      UNION ALL
+      SELECT usuario, 0.0, TOTAL(monto), 0.0, TOTAL(puntos), MAX(notificado_en)
+      FROM retiros GROUP BY usuario
+    )
+    GROUP BY usuario
+    ORDER BY usuario COLLATE NOCASE;
     """
-    return pd.read_sql_query(q, conn)
+    with _RO_LOCK:
+        df = _fast_read_sql(_conn, q)
+    # float64 también sin filas (base vacía): from_records no infiere tipos de una lista vacía
+    return df.astype({c: "float64" for c in ("Monto_cargas", "Monto_descargas", "Puntos_cargas", "Puntos_descargas", "Puntos_actuales")})
 
 # -------- Export helpers --------
 def sqlite_backup_bytes(conn: sqlite3.Connection) -> bytes:
     """Backup binario del SQLite aunque esté abierto."""
+    dst = sqlite3.connect(":memory:")
+    if hasattr(dst, "serialize"):  # Python 3.11+: backup en memoria, sin archivo temporal
+        try:
+            with dst, _DB_LOCK:
+                conn.backup(dst)
+            return dst.serialize()
+        finally:
+            dst.close()
+    dst.close()
     with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp:
         tmp_name = tmp.name
     try:
         dst = sqlite3.connect(tmp_name)
-        with dst:
+        with dst, _DB_LOCK:
             conn.backup(dst)
         dst.close()
         with open(tmp_name, "rb") as f:
@@ -222,7 +324,46 @@ def sqlite_backup_bytes(conn: sqlite3.Connection) -> bytes:
             pass
     return data
 
-def make_full_export_zip(conn: sqlite3.Connection) -> bytes:
+def _decimal_coma(col: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Float -> texto '%.2f' con coma decimal ('1234,50'), vectorizado en Arrow."""
+    cents = pc.cast(pc.round(pc.multiply(col, 100)), pa.int64())
+    a = pc.abs(cents)
+    ent = pc.divide(a, 100)  # división entera
+    dec = pc.utf8_lpad(pc.cast(pc.subtract(a, pc.multiply(ent, 100)), pa.string()), 2, "0")
+    signo = pc.if_else(pc.less(cents, 0), "-", "")
+    return pc.binary_join_element_wise(pc.binary_join_element_wise(signo, pc.cast(ent, pa.string()), ""), dec, ",")
+
+_CSV_ESPECIALES = r'[;"\r\n]'
+
+def csv_excel_bytes(df: pa.Table | pd.DataFrame) -> bytes:
+    """
+    CSV amigable para Excel ES (sep=';', decimal=',', 2 decimales, BOM utf-8) vía pyarrow.csv,
+    sin el formateo celda a celda de pandas.to_csv; fin de línea os.linesep, como pandas.
+    """
+    tbl = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+    # Caso raro: algún texto libre (p. ej. usuario) con ';', comillas o saltos de línea. write_csv no cita
+    # por celda, así que esas tablas van por pandas.to_csv (cita sólo lo necesario, como siempre)
+    if any(
+        pc.any(pc.match_substring_regex(col, _CSV_ESPECIALES)).as_py()
+        for col in tbl.columns
+        if pa.types.is_string(col.type) or pa.types.is_large_string(col.type)
+    ):
+        return tbl.to_pandas().to_csv(index=False, sep=';', decimal=',', float_format='%.2f').encode("utf-8-sig")
+    for i, field in enumerate(tbl.schema):
+        if pa.types.is_floating(field.type):
+            tbl = tbl.set_column(i, field.name, _decimal_coma(tbl.column(i)))
+    buf = io.BytesIO()
+    pacsv.write_csv(tbl, buf, pacsv.WriteOptions(delimiter=';', quoting_style="none", quoting_header="none"))
+    data = buf.getvalue()
+    if os.linesep != "\n":  # write_csv siempre usa '\n'; ninguna celda lo contiene (ver arriba)
+        data = data.replace(b"\n", os.linesep.encode())
+    return b"\xef\xbb\xbf" + data
+
+def situacion_csv_bytes(ro_conn: sqlite3.Connection) -> bytes:
+    """Situación actual en CSV amigable para Excel ES: ; como separador de columnas, , como decimal."""
+    return csv_excel_bytes(resumen_general(ro_conn, str(DB_PATH), db_mtime()))
+
+def make_full_export_zip(conn: sqlite3.Connection, ro_conn: sqlite3.Connection) -> bytes:
     """
     ZIP con:
     - cargas.csv
@@ -232,38 +373,54 @@ def make_full_export_zip(conn: sqlite3.Connection) -> bytes:
     (CSV amigables para Excel ES: sep=';' y decimal=',')
     """
     buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-        df_c = pd.read_sql_query(
-            "SELECT id, usuario, monto, strftime('%d/%m/%Y %H:%M', ts) AS fecha, puntos FROM cargas ORDER BY ts DESC;",
-            conn
+    # CSV con DEFLATE nivel 1 (rápido); el .db va sin comprimir: páginas btree comprimen poco y DEFLATE domina la latencia
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        # Tablas completas a Arrow (esquema fijo), ya redondeadas en SQL
+        tbl_c = _read_arrow(
+            ro_conn,
+            "SELECT id, usuario, ROUND(monto,2) AS monto, strftime('%d/%m/%Y %H:%M', ts) AS fecha, ROUND(puntos,2) AS puntos FROM cargas ORDER BY ts DESC;",
+            MOVIMIENTOS_SCHEMA,
         )
-        df_r = pd.read_sql_query(
-            "SELECT id, usuario, monto, strftime('%d/%m/%Y %H:%M', notificado_en) AS fecha, puntos FROM retiros ORDER BY notificado_en DESC;",
-            conn
+        tbl_r = _read_arrow(
+            ro_conn,
+            "SELECT id, usuario, ROUND(monto,2) AS monto, strftime('%d/%m/%Y %H:%M', notificado_en) AS fecha, ROUND(puntos,2) AS puntos FROM retiros ORDER BY notificado_en DESC;",
+            MOVIMIENTOS_SCHEMA,
         )
-        df_s = resumen_general(conn)
+        df_s = resumen_general(ro_conn, str(DB_PATH), db_mtime())  # sale de la caché si la base no cambió
 
         zf.writestr(
             "cargas.csv",
-            df_c.round(2).to_csv(index=False, sep=';', decimal=',', float_format='%.2f').encode("utf-8-sig")
+            csv_excel_bytes(tbl_c)
         )
         zf.writestr(
             "descargas.csv",
-            df_r.round(2).to_csv(index=False, sep=';', decimal=',', float_format='%.2f').encode("utf-8-sig")
+            csv_excel_bytes(tbl_r)
         )
         zf.writestr(
             "resumen_actual.csv",
-            df_s.round(2).to_csv(index=False, sep=';', decimal=',', float_format='%.2f').encode("utf-8-sig")
+            csv_excel_bytes(df_s)
         )
-        zf.writestr("StarPoint_backup.db", sqlite_backup_bytes(conn))
+        zf.writestr("StarPoint_backup.db", sqlite_backup_bytes(conn), compress_type=zipfile.ZIP_STORED)
     buffer.seek(0)
     return buffer.getvalue()
 
 # --------------------------- Estado app -------------------------------
 
-conn = get_conn()
-init_db(conn)
-normalize_users(conn)  # normaliza usuarios (TRIM) para resumen correcto
+@st.cache_resource
+def _bootstrap() -> sqlite3.Connection:
+    """Conexión compartida entre reruns; init y migraciones corren una vez por proceso."""
+    c = get_conn()
+    init_db(c)  # incluye normalize_users (TRIM) para resumen correcto
+    return c
+
+@st.cache_resource
+def _bootstrap_ro() -> sqlite3.Connection:
+    """Conexión de solo lectura compartida por todas las lecturas (saldo, historial, resumen, export)."""
+    _bootstrap()  # la base y su esquema tienen que existir antes de abrirla en modo ro
+    return get_ro_conn()
+
+conn = _bootstrap()
+ro_conn = _bootstrap_ro()
 
 if "selected_user" not in st.session_state:
     st.session_state.selected_user = ""
@@ -304,13 +461,11 @@ with left:
     st.subheader("Historial (Cargas y Descargas)")
     sel = st.text_input("Usuario para ver historial", value=st.session_state.get("selected_user", ""), placeholder="Escribí un usuario…")
     if sel and sel.strip():
-        df = historial_usuario(conn, sel.strip(), limit=200)
+        df = historial_usuario(ro_conn, str(DB_PATH), db_mtime(), sel.strip(), limit=200)
         if df.empty:
             st.info("Sin movimientos para este usuario aún.")
         else:
-            df_disp = df.drop(columns=["dt"]).copy()
-            df_disp["Monto"]  = df_disp["Monto"].apply(fmt_miles)  # mostrar 2.000 / 10.000
-            df_disp["Puntos"] = df_disp["Puntos"].round(2)        # redondeo visual a 2 decimales
+            df_disp = df.drop(columns=["dt"])  # Monto y Puntos ya vienen formateados desde SQL
             st.dataframe(df_disp, use_container_width=True, height=360, hide_index=True)
     else:
         st.caption("Tip: al registrar una carga, el usuario queda seleccionado automáticamente.")
@@ -321,7 +476,7 @@ with right:
     u_estado = st.text_input("Usuario", value=st.session_state.get("selected_user", ""), placeholder="Ej.: maru5040", key="estado_user")
 
     if u_estado and u_estado.strip():
-        total_actual = total_puntos_usuario(conn, u_estado.strip())
+        total_actual = total_puntos_usuario(ro_conn, u_estado.strip())
         # KPI y badge (sin barra)
         st.markdown(f"<div class='kpi'>{total_actual:.2f}</div><div class='kpi-sub'>Puntos actuales</div>", unsafe_allow_html=True)
         if total_actual < 0:
@@ -366,28 +521,20 @@ st.subheader("Descargas / Exportar")
 colA, colB = st.columns(2)
 
 with colA:
-    df_resumen = resumen_general(conn)
-    # CSV amigable para Excel ES: ; como separador de columnas, , como decimal
-    csv_text = df_resumen.round(2).to_csv(
-        index=False,
-        sep=';',
-        decimal=',',
-        float_format='%.2f'
-    )
-    csv_bytes = csv_text.encode("utf-8-sig")
+    # Callable: el CSV se serializa recién al hacer clic, no en cada rerun
     st.download_button(
         "⬇️ Descargar situación actual (CSV)",
-        data=csv_bytes,
+        data=lambda: situacion_csv_bytes(ro_conn),
         file_name=f"situacion_{datetime.now():%Y%m%d_%H%M}.csv",
         mime="text/csv",
         use_container_width=True
     )
 
 with colB:
-    zip_bytes = make_full_export_zip(conn)
+    # Callable: el ZIP (backup + CSV) se arma recién al hacer clic, no en cada rerun
     st.download_button(
         "⬇️ Descargar base de datos completa (ZIP)",
-        data=zip_bytes,
+        data=lambda: make_full_export_zip(conn, ro_conn),
         file_name=f"starpoint_backup_{datetime.now():%Y%m%d_%H%M}.zip",
         mime="application/zip",
         use_container_width=True